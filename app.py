@@ -5,6 +5,9 @@ from lit_review import run_lit_review
 from weekly_digest import generate_weekly_digest, USER_TOPICS
 from voice_input import listen_to_voice_command
 from voice_output import speak_text
+from study_deep_dive import deep_dive, summarize_study, answer_question
+from source_scraper import paper_keys
+from shared_cache import cache_stats
 
 st.set_page_config(page_title="Kanopik - Your Research Assistant", layout="centered")
 
@@ -24,6 +27,17 @@ with col2:
     st.markdown("<h5>2️⃣ How do you want to interact?</h5>", unsafe_allow_html=True)
     interaction_mode = st.radio("", ["Text", "Voice"], key="interaction_mode")
 
+# --- SHARED CACHE METRICS --- #
+with st.sidebar.expander("📊 Shared cache"):
+    stats = cache_stats()
+    if not stats:
+        st.markdown("No cached calls yet.")
+    for stage, counts in stats.items():
+        st.markdown(
+            f"**{stage}**: {counts['hit_rate']:.0%} hit rate, {counts['saved_calls']} calls saved "
+            f"({counts.get('hits', 0)} hits, {counts.get('joined', 0)} joined in flight, {counts.get('misses', 0)} misses)"
+        )
+
 # --- INPUT FIELD --- #
 query = None
 if mode == "Literature Review":
@@ -39,21 +53,36 @@ if mode == "Literature Review":
     else:
         query = st.text_input("Enter your research question:")
 
-    if query:
+    time_budget = st.number_input("⏱️ Time budget in seconds (0 = no limit)", min_value=0, value=0, step=5)
+    citation_expansion = st.checkbox("🕸️ Also search the citation graph of the best papers (ignored with a time budget)")
+
+    # Keep the latest review across reruns, so deep-dive buttons don't restart the pipeline
+    review_request = (query, time_budget, citation_expansion)
+    if query and st.session_state.get("lit_review_request") != review_request:
         progress_placeholder = st.empty()
         with st.spinner("📡 Researching..."):
-            summary, relevant_sources = run_lit_review(query, progress_slot=progress_placeholder)
+            summary, relevant_sources = run_lit_review(query, progress_slot=progress_placeholder,
+                                                       deadline=time_budget or None,
+                                                       citation_expansion=citation_expansion)
             progress_placeholder.empty()
-
-        st.markdown("---")
-        st.markdown(summary)
+        st.session_state["lit_review_request"] = review_request
+        st.session_state["lit_review"] = (summary, relevant_sources)
+        st.session_state["deep_dive_docs"] = {}
+        st.session_state.pop("follow_up_question", None)
 
         if interaction_mode == "Voice":
             speak_text(summary)
 
+    if st.session_state.get("lit_review"):
+        summary, relevant_sources = st.session_state["lit_review"]
+        deep_dive_docs = st.session_state.setdefault("deep_dive_docs", {})
+
+        st.markdown("---")
+        st.markdown(summary)
+
         # Study Explorer
         with st.expander("🔎 Dive deeper into individual studies"):
-            for study in relevant_sources:
+            for i, study in enumerate(relevant_sources):
                 authors = study.get('authors', [])
                 if isinstance(authors, str):
                     authors = [authors]
@@ -70,8 +99,27 @@ if mode == "Literature Review":
                 st.markdown(f"*Source: {study.get('source', 'unknown').capitalize()}*")
                 st.markdown(study.get("summary") or "No summary available.")
                 st.markdown(f"[🔗 View Full Study]({study.get('url', '#')})")
+
+                if st.button("📄 Read the full text", key=f"deep_dive_{i}"):
+                    with st.spinner("📥 Downloading and reading the full text..."):
+                        deep_dive_docs.update(deep_dive([study]))
+                        key = paper_keys(study)[0] if paper_keys(study) else None
+                        if key in deep_dive_docs:
+                            st.markdown(summarize_study(study, deep_dive_docs[key]))
+                        else:
+                            st.info("No open-access full text is available for this study.")
                 st.markdown("---")
 
+        follow_up = st.text_input("💬 Ask a follow-up question about these studies:")
+        if follow_up and relevant_sources and st.session_state.get("follow_up_question") != follow_up:
+            with st.spinner("📖 Reading the studies..."):
+                missing = [s for s in relevant_sources if paper_keys(s) and paper_keys(s)[0] not in deep_dive_docs]
+                deep_dive_docs.update(deep_dive(missing))
+                st.session_state["follow_up_question"] = follow_up
+                st.session_state["follow_up_answer"] = answer_question(follow_up, relevant_sources, docs=deep_dive_docs)
+        if follow_up and st.session_state.get("follow_up_question") == follow_up:
+            st.markdown(st.session_state["follow_up_answer"])
+
 elif mode == "Weekly Digest":
     st.subheader("📅 Weekly Digest")
 
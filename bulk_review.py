@@ -0,0 +1,305 @@
+import os
+import json
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from query_refinement import build_refine_messages, parse_refined_query
+from source_selector import select_sources, SOURCE_CATEGORIES, DEFAULT_CATEGORY
+from source_scraper import fetch_from_source, dedupe_papers, paper_keys, source_backend
+from relevance_filter import build_score_messages, parse_relevance_score
+from research_agent import build_summary_messages, save_study_metadata, extract_year
+from llm_batch import RateLimiter, DirectLLM, OpenAIBatchLLM, LocalBatchLLM
+
+load_dotenv()
+
+# Requests per second allowed against each paper source, shared by all workers
+RATE_LIMITS = {
+    "arxiv": 1 / 3,
+    "pubmed": 3,
+    "semantic_scholar": 1
+}
+
+# LLM requests are run (and checkpointed) in chunks of this size
+LLM_CHUNK_SIZE = 500
+FETCH_CHECKPOINT_EVERY = 25
+
+BULK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lit_reviews")
+
+
+def load_topics(path):
+    """
+    Reads one topic per line, skipping blank lines, '#' comments, and repeated topics.
+    """
+    topics = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            topic = line.strip()
+            key = " ".join(topic.lower().split())
+            if not topic or topic.startswith("#") or key in seen:
+                continue
+            seen.add(key)
+            topics.append(topic)
+    return topics
+
+def short_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class BulkReview:
+    """
+    Runs many literature reviews stage by stage (refine, classify, fetch, score,
+    summarize) so that work is shared across topics:
+    - identical source queries are fetched once
+    - a paper is scored once per refined query, whichever topics found it
+    - LLM work for a stage is sent as one batch
+
+    All state, including the fetch and score caches, is checkpointed to disk
+    after every chunk of work so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, checkpoint_path, output_path, llm, workers=8, min_score=4, save_sources=False):
+        self.checkpoint_path = checkpoint_path
+        self.output_path = output_path
+        self.llm = llm
+        self.workers = workers
+        self.min_score = min_score
+        self.save_sources = save_sources
+        self.limiters = {backend: RateLimiter(rate) for backend, rate in RATE_LIMITS.items()}
+        self.lock = threading.Lock()
+        self.state = self.load_checkpoint()
+
+    # --- Checkpointing --- #
+
+    def load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                state = json.load(f)
+            done = sum(1 for t in state["topics"].values() if t.get("done"))
+            print(f"♻️ Resuming from checkpoint ({done} topics already done)")
+            return state
+        return {"topics": {}, "fetch_cache": {}, "score_cache": {}}
+
+    def save_checkpoint(self):
+        with self.lock:
+            tmp_path = self.checkpoint_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.checkpoint_path)
+
+    def topic_state(self, topic):
+        return self.state["topics"].setdefault(topic, {})
+
+    def run_llm_stage(self, requests, label, apply):
+        """
+        Sends LLM requests in chunks, applying each chunk's results and checkpointing after it.
+        """
+        ids = list(requests)
+        for start in range(0, len(ids), LLM_CHUNK_SIZE):
+            chunk = {custom_id: requests[custom_id] for custom_id in ids[start:start + LLM_CHUNK_SIZE]}
+            apply(self.llm.complete_all(chunk, label=label))
+            self.save_checkpoint()
+
+    # --- Stages --- #
+
+    def refine(self, topics):
+        todo = [t for t in topics if "refined" not in self.topic_state(t)]
+        requests = {f"refine:{short_hash(t)}": build_refine_messages(t) for t in todo}
+
+        def apply(texts):
+            for t in todo:
+                text = texts.get(f"refine:{short_hash(t)}")
+                # Failed requests are left unrefined so a resumed run retries them
+                if text is None:
+                    continue
+                self.topic_state(t)["refined"] = parse_refined_query(text) if text else t
+
+        self.run_llm_stage(requests, "query refinements", apply)
+
+    def classify(self, topics):
+        todo = [t for t in topics if "sources" not in self.topic_state(t)]
+
+        def run(topic):
+            try:
+                return select_sources(self.topic_state(topic)["refined"])
+            except Exception as e:
+                print(f"⚠️ Source selection failed for '{topic}': {e}")
+                return {"category": DEFAULT_CATEGORY, "sources": SOURCE_CATEGORIES[DEFAULT_CATEGORY]}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            selections = pool.map(run, todo)
+            for t, selection in zip(todo, selections):
+                self.topic_state(t).update(category=selection["category"], sources=selection["sources"])
+        self.save_checkpoint()
+
+    def fetch_keys(self, topic):
+        refined = self.topic_state(topic)["refined"]
+        backends = dict.fromkeys(source_backend(s) for s in self.topic_state(topic)["sources"])
+        return [f"{backend}|{refined}" for backend in backends]
+
+    def fetch(self, topics):
+        cache = self.state["fetch_cache"]
+        todo = list(dict.fromkeys(k for t in topics for k in self.fetch_keys(t) if k not in cache))
+        if not todo:
+            return
+        print(f"🔍 Running {len(todo)} unique source queries...")
+        completed = 0
+
+        def run(key):
+            nonlocal completed
+            backend, query = key.split("|", 1)
+            if backend in self.limiters:
+                self.limiters[backend].acquire()
+            try:
+                papers = fetch_from_source(backend, query)
+            except Exception as e:
+                print(f"⚠️ {backend} fetch failed for '{query}': {e}")
+                return
+            with self.lock:
+                cache[key] = papers
+                completed += 1
+                checkpoint_due = completed % FETCH_CHECKPOINT_EVERY == 0
+            if checkpoint_due:
+                self.save_checkpoint()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(run, todo))
+        self.save_checkpoint()
+
+    def fetched(self, topic):
+        """
+        True once every source query for the topic has been fetched without error.
+        """
+        return all(k in self.state["fetch_cache"] for k in self.fetch_keys(topic))
+
+    def candidate_papers(self, topic):
+        cache = self.state["fetch_cache"]
+        return dedupe_papers([p for k in self.fetch_keys(topic) for p in cache.get(k, [])])
+
+    def score_key(self, topic, paper):
+        return f"score:{short_hash(self.topic_state(topic)['refined'] + '|' + paper_keys(paper)[0])}"
+
+    def score(self, topics):
+        cache = self.state["score_cache"]
+        requests = {}
+        for t in topics:
+            for paper in self.candidate_papers(t):
+                key = self.score_key(t, paper)
+                if key not in cache and key not in requests:
+                    requests[key] = build_score_messages(paper, self.topic_state(t)["refined"])
+
+        def apply(texts):
+            for key, text in texts.items():
+                # Failed requests are left uncached so a resumed run retries them
+                if text is None:
+                    continue
+                try:
+                    cache[key] = parse_relevance_score(text)
+                except ValueError:
+                    cache[key] = 0
+
+        self.run_llm_stage(requests, "relevance scores", apply)
+
+    def relevant_papers(self, topic):
+        cache = self.state["score_cache"]
+        return [p for p in self.candidate_papers(topic) if cache.get(self.score_key(topic, p), 0) >= self.min_score]
+
+    def summary_key(self, topic):
+        # Topics that refine to the same query share one summary
+        return f"summary:{short_hash(self.topic_state(topic)['refined'])}"
+
+    def summarize(self, topics):
+        todo = [t for t in topics if not self.topic_state(t).get("done")]
+        requests = {}
+        for t in todo:
+            relevant = self.relevant_papers(t)
+            if relevant:
+                requests[self.summary_key(t)] = build_summary_messages(self.topic_state(t)["refined"], relevant)
+            else:
+                self.write_result(t, "⚠️ No sufficiently relevant sources found. Try rephrasing your query.", [])
+        # Record those topics as done now, not after the (possibly hours-long) summary batch
+        self.save_checkpoint()
+
+        def apply(texts):
+            for t in todo:
+                text = texts.get(self.summary_key(t))
+                if text and not self.topic_state(t).get("done"):
+                    self.write_result(t, text, self.relevant_papers(t))
+
+        self.run_llm_stage(requests, "summaries", apply)
+
+    def write_result(self, topic, summary, sources):
+        topic_state = self.topic_state(topic)
+        if self.save_sources and sources:
+            save_study_metadata(topic_state["refined"], sources)
+
+        record = {
+            "topic": topic,
+            "refined_query": topic_state["refined"],
+            "category": topic_state["category"],
+            "summary": summary,
+            "sources": [{
+                "title": s.get("title", "Untitled"),
+                "source": s.get("source", "unknown"),
+                "authors": s.get("authors", []),
+                "year": extract_year(s),
+                "url": s.get("url", s.get("link", ""))
+            } for s in sources],
+            "completed_at": datetime.now().isoformat(timespec="seconds")
+        }
+        with self.lock:
+            with open(self.output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            topic_state["done"] = True
+
+    def run(self, topics):
+        pending = [t for t in topics if not self.topic_state(t).get("done")]
+        print(f"\n📚 Kanopik bulk review: {len(pending)} of {len(topics)} topics to run\n")
+        if not pending:
+            return
+
+        self.refine(pending)
+        pending = [t for t in pending if "refined" in self.topic_state(t)]
+        self.classify(pending)
+        self.fetch(pending)
+        # Topics with a failed fetch are left incomplete so a resumed run retries them
+        incomplete = [t for t in pending if not self.fetched(t)]
+        if incomplete:
+            print(f"⚠️ {len(incomplete)} topics had failed source queries and will be retried on the next run")
+        pending = [t for t in pending if self.fetched(t)]
+        self.score(pending)
+        self.summarize(pending)
+
+        done = sum(1 for t in topics if self.topic_state(t).get("done"))
+        print(f"\n✅ {done} of {len(topics)} topics done. Results saved to: {self.output_path}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Kanopik literature reviews for every topic in a file.")
+    parser.add_argument("topics_file", help="Text file with one research topic per line")
+    parser.add_argument("--output", help="JSONL file to append results to (default: lit_reviews/bulk_<name>.jsonl)")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume (default: next to the output)")
+    parser.add_argument("--workers", type=int, default=8, help="Max concurrent fetch and LLM calls")
+    parser.add_argument("--min-score", type=int, default=4, help="Minimum 1-5 relevance score to keep a paper")
+    parser.add_argument("--llm", choices=["direct", "batch", "local-batch"], default="direct",
+                        help="Run LLM work directly, through the OpenAI Batch API, or through a local batch stub")
+    parser.add_argument("--save-sources", action="store_true", help="Also save each topic's sources to summary_sources/")
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.topics_file))[0]
+    os.makedirs(BULK_DIR, exist_ok=True)
+    output_path = args.output or os.path.join(BULK_DIR, f"bulk_{name}.jsonl")
+    checkpoint_path = args.checkpoint or os.path.splitext(output_path)[0] + ".checkpoint.json"
+
+    direct = DirectLLM(max_workers=args.workers)
+    llm = {"direct": direct, "batch": OpenAIBatchLLM(), "local-batch": LocalBatchLLM(direct)}[args.llm]
+
+    bulk = BulkReview(checkpoint_path, output_path, llm, workers=args.workers,
+                      min_score=args.min_score, save_sources=args.save_sources)
+    bulk.run(load_topics(args.topics_file))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import re
+import copy
+import json
+import time
+import threading
+from collections import Counter
+import requests
+from dotenv import load_dotenv
+from source_scraper import SEMANTIC_SCHOLAR_API_URL, SEMANTIC_SCHOLAR_API_KEY, semantic_scholar_paper
+
+load_dotenv()
+
+# Max ids per request to the Semantic Scholar batch endpoint
+S2_BATCH_SIZE = 500
+S2_BATCH_TIMEOUT = 30
+NEIGHBOR_FIELDS = "references.paperId,citations.paperId"
+PAPER_FIELDS = "paperId,title,abstract,authors,year,url,openAccessPdf"
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "s2_cache", "papers.jsonl")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def s2_paper_id(paper):
+    """
+    Returns an id the Semantic Scholar API accepts for a paper from any source, or None.
+    """
+    if paper.get("paperId"):
+        return paper["paperId"]
+    url = paper.get("url", "")
+    match = re.search(r"arxiv\.org/(?:abs|pdf)/([^\s/?#]+?)(?:v\d+)?(?:\.pdf)?$", url)
+    if match:
+        return f"ARXIV:{match.group(1)}"
+    match = re.search(r"pubmed\.ncbi\.nlm\.nih\.gov/(\d+)", url)
+    if match:
+        return f"PMID:{match.group(1)}"
+    match = re.search(r"semanticscholar\.org/paper/(?:[^/]+/)?([0-9a-f]{40})", url)
+    if match:
+        return match.group(1)
+    return None
+
+# --- Cache --- #
+
+def load_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = {}
+            if os.path.exists(CACHE_PATH):
+                with open(CACHE_PATH, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            _cache[(entry["kind"], entry["id"])] = entry["value"]
+                        except (ValueError, KeyError):
+                            continue
+    return _cache
+
+def store_in_cache(kind, values):
+    cache = load_cache()
+    with _cache_lock:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        with open(CACHE_PATH, "a", encoding="utf-8") as f:
+            for paper_id, value in values.items():
+                cache[(kind, paper_id)] = value
+                f.write(json.dumps({"kind": kind, "id": paper_id, "value": value}) + "\n")
+
+# --- Batch lookups --- #
+
+def batch_lookup(ids, fields, kind, parse, budget):
+    """
+    Looks up many papers at once through the Semantic Scholar batch endpoint
+    (up to S2_BATCH_SIZE ids per request), serving what it can from the cache.
+
+    Args:
+        budget (dict): {"requests": n} — remaining requests allowed; decremented per request
+
+    Returns:
+        Dict mapping each id found to a copy of parse(item)
+    """
+    cache = load_cache()
+    missing = [i for i in dict.fromkeys(ids) if (kind, i) not in cache]
+
+    for start in range(0, len(missing), S2_BATCH_SIZE):
+        if budget["requests"] <= 0:
+            print("⚠️ Citation expansion request budget exhausted.")
+            break
+        budget["requests"] -= 1
+        chunk = missing[start:start + S2_BATCH_SIZE]
+
+        time.sleep(1.1)  # to avoid rate limit
+        try:
+            response = requests.post(
+                f"{SEMANTIC_SCHOLAR_API_URL}/paper/batch",
+                params={"fields": fields},
+                json={"ids": chunk},
+                headers={"x-api-key": SEMANTIC_SCHOLAR_API_KEY},
+                timeout=S2_BATCH_TIMEOUT
+            )
+            if response.status_code != 200:
+                print(f"⚠️ Semantic Scholar batch API error: {response.status_code}")
+                continue
+            items = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠️ Semantic Scholar batch API error: {e}")
+            continue
+
+        # Results are in request order, with null for ids Semantic Scholar doesn't know
+        store_in_cache(kind, {
+            paper_id: parse(item) if item else None
+            for paper_id, item in zip(chunk, items)
+        })
+
+    # Copies, since callers annotate papers (e.g. with a relevance_score) and the cache is shared by all sessions
+    return {i: copy.deepcopy(cache[(kind, i)]) for i in ids if cache.get((kind, i)) is not None}
+
+def parse_neighbors(item):
+    linked = (item.get("references") or []) + (item.get("citations") or [])
+    return [p["paperId"] for p in linked if p and p.get("paperId")]
+
+def lookup_neighbors(ids, budget):
+    """
+    Returns the ids of the papers each paper cites or is cited by.
+    """
+    return batch_lookup(ids, NEIGHBOR_FIELDS, "neighbors", parse_neighbors, budget)
+
+def lookup_papers(ids, budget):
+    """
+    Returns paper metadata in the same format as the source scrapers.
+    """
+    return batch_lookup(ids, PAPER_FIELDS, "paper", semantic_scholar_paper, budget)
+
+# --- Expansion --- #
+
+def expand_citations(seed_papers, max_depth=1, max_seeds=5, max_new_papers=40, max_requests=6):
+    """
+    Bounded breadth-first expansion over the citation graph of the best seed papers.
+
+    At each depth, the references and citations of the frontier are fetched in bulk,
+    and the neighbors linked to the most frontier papers are kept (up to the remaining
+    `max_new_papers`). Those become the next frontier.
+
+    Args:
+        seed_papers (list): Relevant papers, best first (see "relevance_score")
+        max_depth (int): Number of hops away from the seeds to explore
+        max_seeds (int): Max papers expanded at each depth
+        max_new_papers (int): Max papers returned
+        max_requests (int): Max requests sent to Semantic Scholar (cache hits are free)
+
+    Returns:
+        List of newly found papers, most linked first
+    """
+    budget = {"requests": max_requests}
+    seeds = sorted(seed_papers, key=lambda p: p.get("relevance_score", 0), reverse=True)
+    frontier = [pid for pid in map(s2_paper_id, seeds) if pid][:max_seeds]
+    seen = set(frontier)
+    found = []
+
+    for _ in range(max_depth):
+        if not frontier or len(found) >= max_new_papers:
+            break
+
+        link_counts = Counter()
+        for neighbors in lookup_neighbors(frontier, budget).values():
+            link_counts.update(n for n in set(neighbors) if n not in seen)
+
+        new_ids = [pid for pid, _ in link_counts.most_common(max_new_papers - len(found))]
+        seen.update(new_ids)
+        papers = lookup_papers(new_ids, budget)
+        found.extend(papers[pid] for pid in new_ids if pid in papers)
+        frontier = [pid for pid in new_ids if pid in papers][:max_seeds]
+
+    return found
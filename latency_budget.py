@@ -0,0 +1,175 @@
+import time
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Share of the remaining time budget each pipeline stage may use, in pipeline order
+STAGE_BUDGET_SHARES = {
+    "refine": 0.1,
+    "select": 0.1,
+    "fetch": 0.3,
+    "filter": 0.25,
+    "summarize": 0.25
+}
+
+# A duplicate request is issued once a call has run longer than this percentile of its past latencies
+HEDGE_PERCENTILE = 0.95
+DEFAULT_HEDGE_DELAY = 3.0
+MIN_LATENCY_SAMPLES = 5
+
+_latencies = defaultdict(lambda: deque(maxlen=200))
+_latency_lock = threading.Lock()
+_hedge_state = threading.local()
+
+# Workers run the actual (blocking) calls; orchestrators wait on them. Keeping them
+# in separate pools means waiting never starves the calls being waited on.
+_workers = ThreadPoolExecutor(max_workers=64, thread_name_prefix="kanopik-call")
+_orchestrators = ThreadPoolExecutor(max_workers=16, thread_name_prefix="kanopik-hedge")
+
+
+def is_hedge():
+    """
+    True inside a hedged duplicate call, which must do the work itself rather
+    than wait on the (shared, in-flight) call it is hedging.
+    """
+    return getattr(_hedge_state, "active", False)
+
+def run_as_hedge(fn, *args, **kwargs):
+    _hedge_state.active = True
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _hedge_state.active = False
+
+def record_latency(name, seconds):
+    with _latency_lock:
+        _latencies[name].append(seconds)
+
+def hedge_delay(name):
+    """
+    Returns how long to wait on a call before hedging it: the HEDGE_PERCENTILE
+    latency seen so far for `name`, or DEFAULT_HEDGE_DELAY until enough samples exist.
+    """
+    with _latency_lock:
+        samples = sorted(_latencies[name])
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return DEFAULT_HEDGE_DELAY
+    return samples[min(len(samples) - 1, int(HEDGE_PERCENTILE * len(samples)))]
+
+
+class LatencyBudget:
+    """
+    End-to-end time budget for one pipeline run. Each stage gets its share of
+    whatever time is left, so time saved by early stages rolls over to later ones.
+    """
+
+    def __init__(self, seconds, shares=STAGE_BUDGET_SHARES):
+        self.total = seconds
+        self.deadline = time.monotonic() + seconds
+        self.shares = dict(shares)
+        self.partial_stages = []
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def stage_timeout(self, stage):
+        """
+        Seconds the given stage may use: its share of the remaining budget,
+        relative to the stages that still have to run.
+        """
+        stages = list(self.shares)
+        upcoming = stages[stages.index(stage):]
+        share = self.shares[stage] / sum(self.shares[s] for s in upcoming)
+        return self.remaining() * share
+
+    def mark_partial(self, stage):
+        if stage not in self.partial_stages:
+            self.partial_stages.append(stage)
+
+    @property
+    def partial(self):
+        return bool(self.partial_stages)
+
+
+def hedged_call(name, fn, *args, timeout=None, hedge=True, **kwargs):
+    """
+    Runs fn(*args, **kwargs). If it is still running after the hedge delay for
+    `name`, a duplicate is issued and whichever finishes first wins.
+
+    Raises:
+        TimeoutError if no attempt finishes within `timeout` seconds
+    """
+    if timeout is not None and timeout <= 0:
+        raise TimeoutError(f"'{name}' had no time left to run")
+
+    start = time.monotonic()
+    end = None if timeout is None else start + timeout
+    hedge_at = start + hedge_delay(name) if hedge else None
+    pending = {_workers.submit(fn, *args, **kwargs)}
+    error = None
+
+    while pending:
+        now = time.monotonic()
+        if end is not None and now >= end:
+            break
+
+        wake_times = [t for t in (hedge_at, end) if t is not None]
+        wait_for = max(0.0, min(wake_times) - now) if wake_times else None
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            if future.exception() is None:
+                record_latency(name, time.monotonic() - start)
+                return future.result()
+            error = future.exception()
+
+        if hedge_at is not None and pending and time.monotonic() >= hedge_at:
+            pending.add(_workers.submit(run_as_hedge, fn, *args, **kwargs))
+            hedge_at = None
+
+    if not pending and error is not None:
+        raise error
+    raise TimeoutError(f"'{name}' did not finish within {timeout:.1f}s")
+
+def hedged_map(name, fn, items, timeout, hedge=True):
+    """
+    Runs fn(item) for every item concurrently as hedged calls, all sharing one deadline.
+
+    Args:
+        name (str or callable): Latency-history name, or a function of the item returning one
+        fn (callable): Function applied to each item
+        items (list): Inputs
+        timeout (float): Seconds until the shared deadline
+        hedge (bool or callable): Whether to hedge, or a function of the item deciding it
+
+    Returns:
+        (results, complete): list of (item, result) pairs for the calls that succeeded
+        in time, in input order, and whether every call finished before the deadline
+    """
+    end = time.monotonic() + timeout
+
+    def run(item):
+        call_name = name(item) if callable(name) else name
+        hedge_item = hedge(item) if callable(hedge) else hedge
+        return hedged_call(call_name, fn, item, timeout=max(0.0, end - time.monotonic()), hedge=hedge_item)
+
+    futures = [_orchestrators.submit(run, item) for item in items]
+    _, not_done = wait(futures, timeout=max(0.0, end - time.monotonic()))
+    complete = not not_done
+
+    results = []
+    for item, future in zip(items, futures):
+        if not future.done():
+            continue
+        error = future.exception()
+        if isinstance(error, TimeoutError):
+            complete = False
+            continue
+        if error is not None:
+            print(f"⚠️ Skipping {name(item) if callable(name) else name} result due to error: {error}")
+            continue
+        results.append((item, future.result()))
+    return results, complete
@@ -1,22 +1,44 @@
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
 from datetime import datetime
 from research_agent import research_agent
 from query_refinement import refine_query
+from latency_budget import LatencyBudget, hedged_call
+from study_deep_dive import deep_dive, answer_question
+from shared_cache import shared_cached
 
-# 🔑 API
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Runs that found no relevant sources (often a transient API failure) are not cached
+@shared_cached("lit_review", key=lambda raw_topic, progress_slot=None, citation_expansion=False: [
+    " ".join(raw_topic.lower().split()), citation_expansion
+], cacheable=lambda result: bool(result[2]))
+def review_topic(raw_topic, progress_slot=None, citation_expansion=False):
+    """
+    Refines the topic and runs the research pipeline. Shared across sessions, so an
+    identical request made while one is running waits for it instead of starting over.
+    """
+    refined_topic = refine_query(raw_topic)
+    summary, relevant_sources = research_agent(refined_topic, progress_slot=progress_slot,
+                                               citation_expansion=citation_expansion)
+    return refined_topic, summary, relevant_sources
 
-def run_lit_review(raw_topic, progress_slot=None):
+def run_lit_review(raw_topic, progress_slot=None, deadline=None, citation_expansion=False):
     """
     Run a literature review based on a voice or text input.
     Returns a refined query, a summary, and follow-up ready conversation history.
+
+    `deadline` is an optional end-to-end time budget in seconds, and `citation_expansion`
+    also searches the citation graph of the best papers (see research_agent).
     """
-    refined_topic = refine_query(raw_topic)
-    summary, relevant_sources = research_agent(refined_topic, progress_slot=progress_slot)
+    if deadline is None:
+        refined_topic, summary, relevant_sources = review_topic(raw_topic, progress_slot=progress_slot,
+                                                                citation_expansion=citation_expansion)
+    else:
+        budget = LatencyBudget(deadline)
+        try:
+            refined_topic = hedged_call("refine", refine_query, raw_topic, timeout=budget.stage_timeout("refine"))
+        except TimeoutError:
+            budget.mark_partial("refine")
+            refined_topic = raw_topic
+        summary, relevant_sources = research_agent(refined_topic, progress_slot=progress_slot, deadline=budget)
 
     # Save to .txt:
     today = datetime.now().strftime("%Y-%m-%d_%H-%M")
@@ -40,29 +62,31 @@ def run_lit_review(raw_topic, progress_slot=None):
 def chat_with_kanopik():
     """
     Terminal-based interaction loop (for manual testing).
+    Follow-up questions are answered from the full text of the studies when available.
     """
     print("\n🧠 Welcome to Kanopik — your research assistant.\n")
     raw_topic = input("🔍 What topic would you like to research? ")
-    summary, conversation_history = run_lit_review(raw_topic)
+    summary, relevant_sources = run_lit_review(raw_topic)
 
     print("\n📜 Research Summary:\n", summary)
 
+    conversation_history = [{"role": "assistant", "content": summary}]
+    docs = None
+
     while True:
         follow_up = input("\n💬 Ask a follow-up question (or type 'exit' to quit): ").strip()
         if follow_up.lower() in ["exit", "quit", "stop"]:
             print("\n👋 Exiting Kanopik. Stay curious!\n")
             break
 
-        conversation_history.append({"role": "user", "content": follow_up})
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=conversation_history
-        )
+        if docs is None:
+            print("📥 Reading the full text of the studies...")
+            docs = deep_dive(relevant_sources)
 
-        reply = response.choices[0].message.content
+        reply = answer_question(follow_up, relevant_sources, docs=docs, history=conversation_history)
         print("\n🤖 Kanopik:\n", reply)
 
+        conversation_history.append({"role": "user", "content": follow_up})
         conversation_history.append({"role": "assistant", "content": reply})
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from openai import OpenAI
+
+# 🔑 API
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+client = OpenAI(api_key=OPENAI_API_KEY)
+
+MODEL = "gpt-4o-mini"
+BATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batches")
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `rate` calls per second (with bursts up to `burst`).
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class DirectLLM:
+    """
+    Runs a batch of chat requests immediately as concurrent, rate-limited API calls.
+    """
+
+    def __init__(self, max_workers=8, requests_per_second=8):
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(requests_per_second, burst=max_workers)
+
+    def _complete(self, messages):
+        self.limiter.acquire()
+        try:
+            response = client.chat.completions.create(model=MODEL, messages=messages)
+            return response.choices[0].message.content
+        except Exception as e:
+            print(f"⚠️ LLM request failed: {e}")
+            return None
+
+    def complete_all(self, requests, label="requests"):
+        """
+        Args:
+            requests (dict): custom_id -> chat messages
+            label (str): Short description used in progress output
+
+        Returns:
+            Dict mapping custom_id to the response text (None for failed requests)
+        """
+        if not requests:
+            return {}
+        print(f"🤖 Running {len(requests)} {label}...")
+        ids = list(requests)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            texts = pool.map(lambda custom_id: self._complete(requests[custom_id]), ids)
+        return dict(zip(ids, texts))
+
+
+class OpenAIBatchLLM:
+    """
+    Submits a batch of chat requests to OpenAI's asynchronous Batch API and waits
+    for the results. Cheaper than direct calls, but results can take hours.
+    """
+
+    def __init__(self, poll_interval=60, completion_window="24h"):
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    def write_batch_file(self, requests, label):
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+        path = os.path.join(BATCH_DIR, f"{label.replace(' ', '_')}_{stamp}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for custom_id, messages in requests.items():
+                f.write(json.dumps({
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {"model": MODEL, "messages": messages}
+                }) + "\n")
+        return path
+
+    def run_batch_file(self, path):
+        """
+        Uploads the batch file, waits for the batch to finish, and returns its output lines.
+        """
+        with open(path, "rb") as f:
+            batch_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
+        )
+        print(f"📦 Submitted batch {batch.id}")
+
+        while batch.status not in ["completed", "failed", "expired", "cancelled"]:
+            time.sleep(self.poll_interval)
+            batch = client.batches.retrieve(batch.id)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            print(f"⚠️ Batch {batch.id} ended with status '{batch.status}'")
+            return []
+        return client.files.content(batch.output_file_id).text.splitlines()
+
+    def complete_all(self, requests, label="requests"):
+        if not requests:
+            return {}
+        print(f"📦 Batching {len(requests)} {label}...")
+        path = self.write_batch_file(requests, label)
+
+        results = {custom_id: None for custom_id in requests}
+        for line in self.run_batch_file(path):
+            try:
+                entry = json.loads(line)
+                results[entry["custom_id"]] = entry["response"]["body"]["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+        return results
+
+
+class LocalBatchLLM(OpenAIBatchLLM):
+    """
+    Stand-in for the Batch API: writes the same batch file, then executes it
+    locally with direct calls and returns results in the Batch API output format.
+    """
+
+    def __init__(self, direct=None):
+        super().__init__()
+        self.direct = direct or DirectLLM()
+
+    def run_batch_file(self, path):
+        with open(path, encoding="utf-8") as f:
+            requests = {entry["custom_id"]: entry["body"]["messages"] for entry in map(json.loads, f)}
+        texts = self.direct.complete_all(requests, label="batched requests locally")
+        return [
+            json.dumps({
+                "custom_id": custom_id,
+                "response": {"body": {"choices": [{"message": {"content": text}}]}}
+            })
+            for custom_id, text in texts.items() if text is not None
+        ]
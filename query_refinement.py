@@ -1,16 +1,16 @@
 import os
 from dotenv import load_dotenv
 from openai import OpenAI
+from shared_cache import shared_cached
 
 # 🔑 API
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 client = OpenAI(api_key=OPENAI_API_KEY)
 
-def refine_query(user_query):
+def build_refine_messages(user_query):
     """
-    Converts a user question into a short, search-optimized phrase
-    for scientific databases like arXiv, PubMed, and Semantic Scholar.
+    Builds the chat messages asking GPT to turn a user question into a search query.
     """
     prompt = (
         f"The user has asked a research question: \"{user_query}\"\n\n"
@@ -19,16 +19,26 @@ def refine_query(user_query):
         "Do not include explanations, punctuation, or bullet points. Output only the query string.\n\n"
         "Search query:"
     )
+    return [
+        {"role": "system", "content": "You are Kanopik, an assistant that reformulates user questions into concise scientific search queries."},
+        {"role": "user", "content": prompt}
+    ]
 
+def parse_refined_query(text):
+    return text.strip().strip('"')
+
+@shared_cached("refine")
+def refine_query(user_query):
+    """
+    Converts a user question into a short, search-optimized phrase
+    for scientific databases like arXiv, PubMed, and Semantic Scholar.
+    """
     response = client.chat.completions.create(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are Kanopik, an assistant that reformulates user questions into concise scientific search queries."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=build_refine_messages(user_query)
     )
 
-    refined_query = response.choices[0].message.content.strip().strip('"')
+    refined_query = parse_refined_query(response.choices[0].message.content)
     return refined_query
 
 # Quick test loop
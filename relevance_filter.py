@@ -1,13 +1,100 @@
 import os
+import re
+import math
+from collections import Counter
 from dotenv import load_dotenv
 from openai import OpenAI
+from latency_budget import hedged_map
+from text_utils import tokenize
+from shared_cache import shared_cached
 
 # 🔑 API
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 client = OpenAI(api_key=OPENAI_API_KEY)
 
-def filter_relevant_papers(papers, query, min_score=4,digest_mode=False):
+def build_score_messages(paper, query):
+    """
+    Builds the chat messages asking GPT to score one paper's relevance to the research question.
+    """
+    text = f"Title: {paper['title']}\nAbstract: {paper.get('summary', '')}"
+    prompt = (
+        f"Rate how relevant the following paper is to the research question:\n"
+        f"\"{query}\"\n\n"
+        f"{text}\n\n"
+        "Score the relevance from 1 (not relevant) to 5 (very relevant). Only respond with the number."
+    )
+    return [
+        {"role": "system", "content": "You are a helpful assistant that scores scientific relevance."},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_relevance_score(text):
+    return int(text.strip())
+
+def parse_topic_scores(text, count):
+    """
+    Parses one 1-5 score per topic from a reply like "4, 2, 5", also accepting one
+    score per line with or without list numbering ("1. 4\n2. 2\n3. 5").
+
+    Raises:
+        ValueError if there aren't exactly `count` scores, or one isn't a whole number from 1 to 5
+    """
+    items = [item for item in re.split(r"[,;\n]", text) if item.strip()]
+    scores = []
+    for item in items:
+        # Drop list numbering ("1. ", "2) ", "Topic 3: ") before the score itself
+        item = re.sub(r"^\s*(?:topic\s*)?\d+\s*[.):]\s+(?=\d)", "", item, flags=re.IGNORECASE)
+        numbers = re.findall(r"\d+(?:\.\d+)?", item)
+        if not numbers:
+            continue
+        if len(numbers) > 1 or "." in numbers[0]:
+            raise ValueError(f"'{item.strip()}' is not a single whole score in '{text.strip()}'")
+        score = int(numbers[0])
+        if not 1 <= score <= 5:
+            raise ValueError(f"score {score} is outside 1-5 in '{text.strip()}'")
+        scores.append(score)
+
+    if len(scores) != count:
+        raise ValueError(f"expected {count} scores, got '{text.strip()}'")
+    return scores
+
+@shared_cached("score", key=lambda paper, query: [paper.get("title"), paper.get("summary"), query])
+def score_paper(paper, query):
+    """
+    Scores one paper's relevance to the research question from 1 to 5 with a GPT call.
+    """
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=build_score_messages(paper, query)
+    )
+
+    return parse_relevance_score(response.choices[0].message.content)
+
+def prerank_papers(papers, query, limit=None):
+    """
+    Cheaply orders papers by TF-IDF weighted word overlap between the query and
+    each title and abstract, so only the most promising ones are sent to GPT scoring.
+
+    Args:
+        papers (list): Candidate papers
+        query (str): Research question or topic
+        limit (int): Optional max number of papers to return
+
+    Returns:
+        Papers sorted from most to least promising
+    """
+    query_tokens = set(tokenize(query))
+    paper_tokens = [set(tokenize(f"{p.get('title', '')} {p.get('summary') or ''}")) for p in papers]
+    doc_freq = Counter(t for tokens in paper_tokens for t in tokens & query_tokens)
+
+    def score(tokens):
+        return sum(math.log((1 + len(papers)) / (1 + doc_freq[t])) + 1 for t in tokens & query_tokens)
+
+    ranked = [p for _, p in sorted(zip(map(score, paper_tokens), papers), key=lambda pair: pair[0], reverse=True)]
+    return ranked[:limit] if limit is not None else ranked
+
+def filter_relevant_papers(papers, query, min_score=4, digest_mode=False, budget=None):
     """
     Filters out irrelevant papers using GPT-based semantic scoring.
 
@@ -15,35 +102,33 @@ def filter_relevant_papers(papers, query, min_score=4,digest_mode=False):
         papers (list): List of dicts with keys "title" and "summary"
         query (str): Research question or topic
         min_score (int): Minimum 1-5 relevance score to keep a paper
+        budget (LatencyBudget): Optional time budget; papers are then scored concurrently
+            as hedged calls and unscored papers are dropped once the filter stage runs out of time
 
     Returns:
         List of filtered papers
     """
     if digest_mode:
         min_score = 3
-        
+
+    if budget is not None:
+        results, complete = hedged_map("score", lambda paper: score_paper(paper, query), papers,
+                                       timeout=budget.stage_timeout("filter"))
+        if not complete:
+            budget.mark_partial("filter")
+        filtered = []
+        for paper, score in results:
+            paper["relevance_score"] = score
+            if score >= min_score:
+                filtered.append(paper)
+        return filtered
+
     filtered = []
 
     for paper in papers:
-        text = f"Title: {paper['title']}\nAbstract: {paper.get('summary', '')}"
-        prompt = (
-            f"Rate how relevant the following paper is to the research question:\n"
-            f"\"{query}\"\n\n"
-            f"{text}\n\n"
-            "Score the relevance from 1 (not relevant) to 5 (very relevant). Only respond with the number."
-        )
-
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that scores scientific relevance."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-
-            score_text = response.choices[0].message.content.strip()
-            score = int(score_text)
+            score = score_paper(paper, query)
+            paper["relevance_score"] = score
 
             if score >= min_score:
                 filtered.append(paper)
@@ -53,3 +138,64 @@ def filter_relevant_papers(papers, query, min_score=4,digest_mode=False):
             continue
 
     return filtered
+
+
+@shared_cached("score", key=lambda paper, topics: [paper.get("title"), paper.get("summary"), topics])
+def score_paper_for_topics(paper, topics):
+    """
+    Scores one paper against several research topics in a single GPT call.
+
+    Returns:
+        List of 1-5 relevance scores, one per topic
+
+    Raises:
+        ValueError if the response doesn't hold one valid score per topic
+    """
+    text = f"Title: {paper['title']}\nAbstract: {paper.get('summary', '')}"
+    topic_list = "\n".join(f"{i}. {topic}" for i, topic in enumerate(topics, start=1))
+    prompt = (
+        f"Rate how relevant the following paper is to each of these research topics:\n"
+        f"{topic_list}\n\n"
+        f"{text}\n\n"
+        "Score the relevance to each topic from 1 (not relevant) to 5 (very relevant). "
+        f"Only respond with {len(topics)} comma-separated numbers, in the same order as the topics."
+    )
+
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that scores scientific relevance."},
+            {"role": "user", "content": prompt}
+        ]
+    )
+
+    return parse_topic_scores(response.choices[0].message.content, len(topics))
+
+
+def route_papers_to_topics(papers, topics, min_score=3):
+    """
+    Scores every paper against all topics at once (one GPT call per paper, not per
+    paper x topic) and routes each paper to the topics it is relevant to.
+
+    Args:
+        papers (list): Deduplicated list of candidate papers
+        topics (list): Research topics to route papers to
+        min_score (int): Minimum 1-5 relevance score for a paper to be kept under a topic
+
+    Returns:
+        Dict mapping each topic to its list of relevant papers
+    """
+    routed = {topic: [] for topic in topics}
+
+    for paper in papers:
+        try:
+            scores = score_paper_for_topics(paper, topics)
+        except Exception as e:
+            print(f"⚠️ Skipping paper due to error: {e}")
+            continue
+
+        for topic, score in zip(topics, scores):
+            if score >= min_score:
+                routed[topic].append(paper)
+
+    return routed
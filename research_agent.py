@@ -4,9 +4,12 @@ import requests
 import arxiv
 from openai import OpenAI
 from datetime import datetime
-from source_selector import select_sources
-from source_scraper import fetch_from_sources
-from relevance_filter import filter_relevant_papers
+from source_selector import select_sources, SOURCE_CATEGORIES, DEFAULT_CATEGORY
+from source_scraper import fetch_from_sources, dedupe_papers
+from relevance_filter import filter_relevant_papers, prerank_papers
+from citation_graph import expand_citations
+from latency_budget import LatencyBudget, hedged_call
+from shared_cache import shared_cached
 import json
 import re
 
@@ -34,6 +37,7 @@ def extract_year(study):
 def save_study_metadata(topic, studies):
     date_str = datetime.now().strftime("%Y-%m-%d")
     filename = f"{normalize_filename(topic)}_{date_str}.json"
+    os.makedirs("summary_sources", exist_ok=True)
     path = os.path.join("summary_sources", filename)
 
     json_data = []
@@ -52,9 +56,9 @@ def save_study_metadata(topic, studies):
     return path
 
 
-def summarize_research(topic, sources, digest_mode=False, since_date=None):
+def build_summary_messages(topic, sources, digest_mode=False):
     """
-    Summarizes key findings from a list of sources using GPT-4o-mini, with structure and depth.
+    Builds the chat messages asking GPT to summarize a list of sources on a topic.
     """
     research_text = f"Research topic: {topic}\n\n"
     
@@ -117,42 +121,128 @@ def summarize_research(topic, sources, digest_mode=False, since_date=None):
             "Write in clear, vivid language that flows like a narrative, but make sure to preserve technical accuracy."
         )
 
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Summarize the following papers:\n\n{research_text}"}
+    ]
+
+@shared_cached("summarize", key=lambda topic, sources, digest_mode=False, since_date=None: [
+    topic, [(s.get("title"), s.get("url"), s.get("summary")) for s in sources], digest_mode
+])
+def summarize_research(topic, sources, digest_mode=False, since_date=None):
+    """
+    Summarizes key findings from a list of sources using GPT-4o-mini, with structure and depth.
+    """
     completion = client.chat.completions.create(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Summarize the following papers:\n\n{research_text}"}
-        ]
+        messages=build_summary_messages(topic, sources, digest_mode=digest_mode)
     )
 
     return completion.choices[0].message.content
 
-def research_agent(topic, progress_slot=None, digest_mode=False, since_date=None):
+def fallback_summary(topic, sources):
+    """
+    Builds a plain list of the studies in hand, used when there is no time left to summarize them.
+    """
+    lines = [f"Studies found so far on \"{topic}\":\n"]
+    for s in sources:
+        lines.append(f"- **{s.get('title', 'Untitled')}** ({s.get('year', 'unknown')}) — 🔗 {s.get('url', s.get('link', ''))}")
+    return "\n".join(lines)
+
+STAGE_LABELS = {
+    "refine": "query refinement",
+    "select": "source selection",
+    "fetch": "paper retrieval",
+    "filter": "relevance filtering",
+    "summarize": "summarization"
+}
+
+def partial_notice(budget):
+    stages = ', '.join(STAGE_LABELS.get(stage, stage) for stage in budget.partial_stages)
+    return (
+        f"⚠️ **Partial results:** the {budget.total:g}s time budget ran out during {stages}, "
+        "so this summary is based on incomplete data.\n\n"
+    )
+
+# Max unscored papers to summarize when the filter stage times out before scoring any
+MAX_UNSCORED_PAPERS = 8
+
+# Max citation-graph papers sent to relevance scoring after pre-ranking
+MAX_EXPANSION_CANDIDATES = 15
+
+def expand_with_citations(topic, all_sources, relevant_sources, progress_slot=None):
+    """
+    Adds relevant papers linked to the best sources through the citation graph.
+    New papers are deduped against everything already retrieved and pre-ranked
+    before they are scored like any other source.
+    """
+    if progress_slot:
+        progress_slot.markdown("🕸️ Expanding through the citation graph...")
+    try:
+        linked = expand_citations(relevant_sources)
+    except Exception as e:
+        print(f"⚠️ Citation expansion failed: {e}")
+        return relevant_sources
+    linked_ids = {id(p) for p in linked}
+    new_papers = [p for p in dedupe_papers(all_sources + linked) if id(p) in linked_ids]
+
+    candidates = prerank_papers(new_papers, topic, limit=MAX_EXPANSION_CANDIDATES)
+    added = filter_relevant_papers(candidates, topic)
+    if progress_slot:
+        progress_slot.markdown(f"🕸️ Added {len(added)} relevant papers from the citation graph.\n")
+    return relevant_sources + added
+
+def research_agent(topic, progress_slot=None, digest_mode=False, since_date=None, deadline=None, citation_expansion=False):
     """
     Runs the research assistant pipeline:
     1. Selects the best sources
     2. Fetches content from them
     3. Summarizes the findings
+
+    If `deadline` is given (seconds, or a LatencyBudget), each stage gets a share of it,
+    slow calls are hedged, and once time runs out a summary is built from whatever
+    is in hand and labelled as partial.
+
+    If `citation_expansion` is set, the references and citations of the most relevant
+    papers are also searched (not in digest mode, which only covers new papers,
+    and not under a deadline).
     """
+    budget = deadline
+    if deadline is not None and not isinstance(deadline, LatencyBudget):
+        budget = LatencyBudget(deadline)
 
     # Source selection:
-    selection = select_sources(topic)
+    if budget is not None:
+        try:
+            selection = hedged_call("select", select_sources, topic, timeout=budget.stage_timeout("select"))
+        except TimeoutError:
+            budget.mark_partial("select")
+            selection = {"category": DEFAULT_CATEGORY, "sources": SOURCE_CATEGORIES[DEFAULT_CATEGORY]}
+    else:
+        selection = select_sources(topic)
     sources_str = ', '.join(selection['sources'])
     if progress_slot:
         progress_slot.markdown(f"📌 Category: {selection['category']}")
         progress_slot.markdown(f"🔍 Searching in: {sources_str}")
     
     # Paper selection:
-    all_sources = fetch_from_sources(topic, selection["sources"], since_date=since_date if digest_mode else None)
+    all_sources = fetch_from_sources(topic, selection["sources"], since_date=since_date if digest_mode else None, budget=budget)
     if progress_slot:
         progress_slot.markdown(f"\n📄 Retrieved {len(all_sources)} total papers\n")
     if not all_sources or len(all_sources) == 0:
+        if budget is not None and budget.partial:
+            return partial_notice(budget) + "⚠️ No sources arrived in time. Try again with a larger time budget.", []
         return "⚠️ No sources found for this topic. Try changing your query.", []
     
     # Relevance filtering:
     if progress_slot:
         progress_slot.markdown("🧹 Filtering for relevance...")
-    relevant_sources = filter_relevant_papers(all_sources, topic, digest_mode=digest_mode)
+    relevant_sources = filter_relevant_papers(all_sources, topic, digest_mode=digest_mode, budget=budget)
+
+    # Out of time with nothing relevant yet: summarize the papers that were never scored,
+    # but never ones that were scored and rejected
+    if not relevant_sources and budget is not None and "filter" in budget.partial_stages:
+        relevant_sources = [p for p in all_sources if "relevance_score" not in p][:MAX_UNSCORED_PAPERS]
     
     # If no sources left, return:
     if not relevant_sources:
@@ -163,6 +253,10 @@ def research_agent(topic, progress_slot=None, digest_mode=False, since_date=None
         if progress_slot:
             progress_slot.markdown(f"🏆 {len(relevant_sources)} of {len(all_sources)} sources were considered most relevant.\n")
 
+    # Citation-graph expansion:
+    if citation_expansion and not digest_mode and budget is None:
+        relevant_sources = expand_with_citations(topic, all_sources, relevant_sources, progress_slot=progress_slot)
+
     if not digest_mode and len(relevant_sources) < 3:
         if progress_slot:
             progress_slot.markdown("⚠️ Very few relevant papers found. The topic may be underexplored, or the query may need rephrasing.")
@@ -173,7 +267,20 @@ def research_agent(topic, progress_slot=None, digest_mode=False, since_date=None
     # Create and display summary:
     if progress_slot:
         progress_slot.markdown("📝 Summarizing findings...")
-    summary = summarize_research(topic, relevant_sources, digest_mode=digest_mode, since_date=since_date)
+    if budget is None:
+        summary = summarize_research(topic, relevant_sources, digest_mode=digest_mode, since_date=since_date)
+        return summary, relevant_sources
+
+    try:
+        # Summaries are long completions, so they get a timeout but are not duplicated
+        summary = hedged_call("summarize", summarize_research, topic, relevant_sources, digest_mode=digest_mode,
+                              since_date=since_date, timeout=budget.stage_timeout("summarize"), hedge=False)
+    except TimeoutError:
+        budget.mark_partial("summarize")
+        summary = fallback_summary(topic, relevant_sources)
+
+    if budget.partial:
+        summary = partial_notice(budget) + summary
     return summary, relevant_sources
 
 if __name__ == "__main__":
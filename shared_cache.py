@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+from latency_budget import is_hedge
+
+load_dotenv()
+
+# Set KANOPIK_SHARED_CACHE=0 to disable, and KANOPIK_SHARED_CACHE_PATH to a SQLite
+# file to share the cache (and in-flight requests) between server processes
+CACHE_ENABLED = os.getenv("KANOPIK_SHARED_CACHE", "1") != "0"
+CACHE_PATH = os.getenv("KANOPIK_SHARED_CACHE_PATH")
+
+# How long each stage's results stay fresh, in seconds
+STAGE_TTLS = {
+    "refine": 7 * 24 * 3600,
+    "classify": 30 * 24 * 3600,
+    "fetch": 6 * 3600,
+    "score": 30 * 24 * 3600,
+    "summarize": 24 * 3600,
+    "lit_review": 3600
+}
+DEFAULT_TTL = 3600
+
+MAX_MEMORY_ENTRIES = 5000
+
+# How long another call (in this process or another) may hold a request before we stop waiting and run it ourselves
+INFLIGHT_LEASE_SECONDS = 300
+INFLIGHT_POLL_SECONDS = 0.5
+
+
+class SharedCache:
+    """
+    Process-wide cache for pipeline stage outputs, shared by every session of
+    the Streamlit server, with optional SQLite persistence shared across processes.
+
+    Identical calls that arrive while one is already running wait for its
+    result instead of starting their own. Values are stored as JSON, so every
+    caller gets its own copy and can mutate it freely.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.memory = OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.metrics = defaultdict(lambda: defaultdict(int))
+        if path:
+            with self.connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, stage TEXT, value TEXT, expires_at REAL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS inflight (key TEXT PRIMARY KEY, expires_at REAL)")
+
+    # --- Storage tiers --- #
+
+    def connect(self):
+        if getattr(self.local, "conn", None) is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.local.conn = sqlite3.connect(self.path, timeout=30)
+        return self.local.conn
+
+    def get(self, key):
+        """
+        Returns the cached JSON value for key, or None.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.memory.move_to_end(key)
+                    return entry[1]
+                del self.memory[key]
+
+        if self.path:
+            row = self.connect().execute("SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+            if row:
+                self.remember(key, row[0], row[1])
+                return row[0]
+        return None
+
+    def remember(self, key, value, expires_at):
+        with self.lock:
+            self.memory[key] = (expires_at, value)
+            self.memory.move_to_end(key)
+            while len(self.memory) > MAX_MEMORY_ENTRIES:
+                self.memory.popitem(last=False)
+
+    def put(self, stage, key, value, ttl):
+        expires_at = time.time() + ttl
+        self.remember(key, value, expires_at)
+        if self.path:
+            with self.connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (key, stage, value, expires_at))
+
+    # --- Cross-process in-flight leases --- #
+
+    def acquire_lease(self, key):
+        if not self.path:
+            return True
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("DELETE FROM inflight WHERE key = ? AND expires_at <= ?", (key, now))
+            inserted = conn.execute("INSERT OR IGNORE INTO inflight VALUES (?, ?)", (key, now + INFLIGHT_LEASE_SECONDS)).rowcount
+        return inserted == 1
+
+    def release_lease(self, key):
+        if self.path:
+            with self.connect() as conn:
+                conn.execute("DELETE FROM inflight WHERE key = ?", (key,))
+
+    def wait_for_other_process(self, key):
+        """
+        Polls for the result of a request another process is running, until its lease expires.
+        """
+        deadline = time.time() + INFLIGHT_LEASE_SECONDS
+        while time.time() < deadline:
+            time.sleep(INFLIGHT_POLL_SECONDS)
+            value = self.get(key)
+            if value is not None:
+                return value
+            if self.acquire_lease(key):
+                return None
+        return None
+
+    # --- Calls --- #
+
+    def call(self, stage, key_parts, cacheable, fn, *args, **kwargs):
+        """
+        Returns fn(*args, **kwargs), served from the cache or from an identical call
+        already in flight when possible. Results are stored only if cacheable(result).
+        """
+        key = hashlib.sha256(json.dumps([stage, key_parts], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        ttl = STAGE_TTLS.get(stage, DEFAULT_TTL)
+
+        value = self.get(key)
+        if value is not None:
+            self.count(stage, "hits")
+            return json.loads(value)
+
+        # Hedged duplicates must run for real rather than wait on the call they are hedging
+        if is_hedge():
+            self.count(stage, "misses")
+            return self.run(stage, key, ttl, cacheable, fn, *args, **kwargs)
+
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.inflight[key] = future
+
+        if not leader:
+            try:
+                value = future.result(timeout=INFLIGHT_LEASE_SECONDS)
+            except FutureTimeoutError:
+                # The call we joined looks stuck: run it ourselves, as with an expired lease
+                self.count(stage, "misses")
+                return self.run(stage, key, ttl, cacheable, fn, *args, **kwargs)
+            self.count(stage, "joined")
+            return json.loads(value)
+
+        try:
+            value = None
+            if not self.acquire_lease(key):
+                value = self.wait_for_other_process(key)
+            if value is not None:
+                self.count(stage, "joined")
+            else:
+                self.count(stage, "misses")
+                try:
+                    value = json.dumps(self.run(stage, key, ttl, cacheable, fn, *args, **kwargs))
+                finally:
+                    self.release_lease(key)
+            future.set_result(value)
+            return json.loads(value)
+        except BaseException as e:
+            self.count(stage, "errors")
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def run(self, stage, key, ttl, cacheable, fn, *args, **kwargs):
+        result = fn(*args, **kwargs)
+        # Failed results (e.g. an empty fetch) are returned but not cached
+        if cacheable(result):
+            self.put(stage, key, json.dumps(result), ttl)
+        return result
+
+    # --- Metrics --- #
+
+    def count(self, stage, event):
+        with self.lock:
+            self.metrics[stage][event] += 1
+
+    def stats(self):
+        """
+        Returns per-stage counts of hits, joined in-flight calls, misses and errors,
+        with the hit rate and the number of calls saved.
+        """
+        with self.lock:
+            metrics = {stage: dict(counts) for stage, counts in self.metrics.items()}
+        for counts in metrics.values():
+            saved = counts.get("hits", 0) + counts.get("joined", 0)
+            total = saved + counts.get("misses", 0)
+            counts["saved_calls"] = saved
+            counts["hit_rate"] = saved / total if total else 0.0
+        return metrics
+
+
+_shared_cache = SharedCache(CACHE_PATH)
+
+def shared_cached(stage, key=None, cacheable=bool):
+    """
+    Decorator that routes a pipeline stage through the shared cache.
+
+    Args:
+        stage (str): Stage name, used for the TTL and the metrics
+        key (callable): Optional function of the call's arguments returning what
+            identifies the call (defaults to all arguments)
+        cacheable (callable): Function of the result deciding whether to store it
+            (defaults to storing any non-empty result)
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return fn(*args, **kwargs)
+            key_parts = key(*args, **kwargs) if key else [args, kwargs]
+            return _shared_cache.call(stage, [fn.__module__, fn.__name__, key_parts], cacheable, fn, *args, **kwargs)
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+def cache_stats():
+    return _shared_cache.stats()
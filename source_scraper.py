@@ -1,14 +1,25 @@
 import os
+import re
+import socket
 import requests
 import arxiv
 import time
 from Bio import Entrez
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from latency_budget import hedged_map
+from shared_cache import shared_cached
 
 load_dotenv()
 Entrez.email = os.getenv("EMAIL_FOR_ENTREZ")
 SEMANTIC_SCHOLAR_API_KEY = os.getenv("SEMANTIC_SCHOLAR_API_KEY")
+SEMANTIC_SCHOLAR_API_URL = os.getenv("SEMANTIC_SCHOLAR_API_URL", "https://api.semanticscholar.org/graph/v1")
+
+# Seconds before a stalled source request gives up, so abandoned calls don't hold worker threads forever
+REQUEST_TIMEOUT = 30
+# Entrez has no timeout option, so its requests use the default socket timeout
+if socket.getdefaulttimeout() is None:
+    socket.setdefaulttimeout(REQUEST_TIMEOUT)
 
 def scrape_arxiv(query, max_results=10, since_date=None):
     client = arxiv.Client()
@@ -100,92 +111,132 @@ def scrape_pubmed(query, max_results=10, since_date=None):
             continue
     return articles
 
+def semantic_scholar_paper(item):
+    title = item.get("title", "Untitled")
+    abstract = item.get("abstract", "No abstract available.")
+    url = item.get("url", "")
+    year = item.get("year", "unknown")
+    authors_raw = item.get("authors", [])
+    authors = [f"{a.get('name')}" for a in authors_raw if a.get("name")]
+
+    return {
+        "title": title,
+        "summary": abstract,
+        "url": url,
+        "year": str(year),
+        "authors": authors,
+        "source": "semantic_scholar",
+        "paperId": item.get("paperId"),
+        "pdf_url": (item.get("openAccessPdf") or {}).get("url")
+    }
+
 def scrape_semantic_scholar(query, max_results=10, since_date=None):
     time.sleep(1.1) # to avoid rate limit
-    url = "https://api.semanticscholar.org/graph/v1/paper/search"
+    url = f"{SEMANTIC_SCHOLAR_API_URL}/paper/search"
     since_date = (datetime.now().date() - timedelta(days=7)).strftime("%Y-%m-%d")
     
     params = {
     "query": query,
     "limit": max_results,
-    "fields": "title,abstract,authors,year,publicationDate,url"
+    "fields": "title,abstract,authors,year,publicationDate,url,openAccessPdf"
     }
     if since_date:
         params["publicationDateOrYear"] = f"{since_date}:"
 
     headers = {"x-api-key": SEMANTIC_SCHOLAR_API_KEY}
-    response = requests.get(url, params=params, headers=headers)
+    response = requests.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
 
     if response.status_code != 200:
         print(f"⚠️ Semantic Scholar API error: {response.status_code}")
         return []
 
-    papers = []
-    for item in response.json().get("data", []):
-        title = item.get("title", "Untitled")
-        abstract = item.get("abstract", "No abstract available.")
-        url = item.get("url", "")
-        year = item.get("year", "unknown")
-        authors_raw = item.get("authors", [])
-        authors = [f"{a.get('name')}" for a in authors_raw if a.get("name")]
-
-        papers.append({
-            "title": title,
-            "summary": abstract,
-            "url": url,
-            "year": str(year),
-            "authors": authors,
-            "source": "semantic_scholar"
-        })
-    return papers
-
-def scrape_biorxiv(query, max_results=10, since_date=None):
-    print("⚠️ bioRxiv scraping not yet implemented. Falling back to Semantic Scholar.")
-    return scrape_semantic_scholar(query, max_results)
-
-def scrape_ssrn(query, max_results=10, since_date=None):
-    print("⚠️ SSRN scraping not yet implemented. Falling back to Semantic Scholar.")
-    return scrape_semantic_scholar(query, max_results)
-
-def scrape_nber(query, max_results=10, since_date=None):
-    print("⚠️ NBER scraping not yet implemented. Falling back to Semantic Scholar.")
-    return scrape_semantic_scholar(query, max_results)
-
-def scrape_repec(query, max_results=10, since_date=None):
-    print("⚠️ RePEc scraping not yet implemented. Falling back to Semantic Scholar.")
-    return scrape_semantic_scholar(query, max_results)
+    return [semantic_scholar_paper(item) for item in response.json().get("data", [])]
 
 def unsupported_scrape_warning(source):
     print(f"⚠️ '{source}' is not yet implemented. Skipping.")
     return []
 
-def fetch_from_sources(query, selected_sources, since_date=None):
+def paper_keys(paper):
+    """
+    Returns the identities of a paper (URL and normalized title) so the same
+    study found through different sources or queries can be recognised.
+    """
+    keys = []
+    url = (paper.get("url") or paper.get("link") or "").strip().lower().rstrip("/")
+    if url:
+        keys.append(url)
+    title = re.sub(r"[^a-z0-9]+", " ", (paper.get("title") or "").lower()).strip()
+    if title and title != "untitled":
+        keys.append(title)
+    return keys
+
+def dedupe_papers(papers):
+    """
+    Removes duplicate papers (same URL or same normalized title),
+    keeping the first occurrence and the original order.
+    """
+    seen = set()
+    unique = []
+    for paper in papers:
+        keys = paper_keys(paper)
+        if not keys or any(key in seen for key in keys):
+            continue
+        seen.update(keys)
+        unique.append(paper)
+    return unique
+
+# Sources without their own scraper, served by the Semantic Scholar search
+SEMANTIC_SCHOLAR_FALLBACKS = ["biorxiv", "ssrn", "nber", "repec", "sciencedirect", "springerlink", "ieee_xplore"]
+
+# Backends that must not be hedged: they rate-limit, and a rate-limited search returns [] as if it succeeded
+UNHEDGED_BACKENDS = ["semantic_scholar"]
+
+def source_backend(source):
+    """
+    Returns the backend that actually serves a source, so sources sharing one are only queried once.
+    """
+    source = source.lower()
+    return "semantic_scholar" if source in SEMANTIC_SCHOLAR_FALLBACKS else source
+
+@shared_cached("fetch")
+def fetch_from_source(source, query, since_date=None):
+    source = source_backend(source)
+
+    if source == "arxiv":
+        return scrape_arxiv(query, since_date=since_date)
+    elif source == "pubmed":
+        return scrape_pubmed(query)
+    elif source == "semantic_scholar":
+        return scrape_semantic_scholar(query, since_date=since_date)
+    else:
+        return unsupported_scrape_warning(source)
+
+def fetch_from_sources(query, selected_sources, since_date=None, budget=None):
+    """
+    Fetches papers from every selected source, querying each backend once even when
+    several sources fall back to it. With a LatencyBudget, backends are queried
+    concurrently as hedged calls (except rate-limited ones), and whatever arrives
+    before the fetch stage's deadline is returned.
+    """
+    backends = list(dict.fromkeys(source_backend(source) for source in selected_sources))
+
+    if budget is not None:
+        print(f"🔍 Fetching from {', '.join(backends)}...")
+        results, complete = hedged_map(
+            lambda backend: f"fetch:{backend}",
+            lambda backend: fetch_from_source(backend, query, since_date=since_date),
+            backends,
+            timeout=budget.stage_timeout("fetch"),
+            hedge=lambda backend: backend not in UNHEDGED_BACKENDS
+        )
+        if not complete:
+            budget.mark_partial("fetch")
+        return [paper for _, papers in results for paper in papers]
+
     collected_data = []
-    for source in selected_sources:
+    for source in backends:
         print(f"🔍 Fetching from {source}...")
-        source = source.lower()
-
-        if source == "arxiv":
-            collected_data.extend(scrape_arxiv(query, since_date=since_date))
-        elif source == "pubmed":
-            collected_data.extend(scrape_pubmed(query))
-        elif source == "semantic_scholar":
-            collected_data.extend(scrape_semantic_scholar(query, since_date=since_date))
-        
-        # not supported yet:
-        elif source == "biorxiv":
-            collected_data.extend(scrape_biorxiv(query, since_date=since_date))
-        elif source == "ssrn":
-            collected_data.extend(scrape_ssrn(query, since_date=since_date))
-        elif source == "nber":
-            collected_data.extend(scrape_nber(query, since_date=since_date))
-        elif source == "repec":
-            collected_data.extend(scrape_repec(query, since_date=since_date))
-        elif source in ["sciencedirect", "springerlink", "ieee_xplore"]:
-            collected_data.extend(scrape_semantic_scholar(query, since_date=since_date))
-
-        else:
-            collected_data.extend(unsupported_scrape_warning(source))
+        collected_data.extend(fetch_from_source(source, query, since_date=since_date))
 
     return collected_data
 
@@ -1,7 +1,12 @@
 import os
+import math
+import threading
+from collections import Counter, defaultdict
 from dotenv import load_dotenv
 from openai import OpenAI
 import json
+from text_utils import tokenize
+from shared_cache import shared_cached
 
 # 🔑 API
 load_dotenv()
@@ -29,8 +34,161 @@ SOURCE_CATEGORIES = {
 
 # Available categories
 VALID_CATEGORIES = list(SOURCE_CATEGORIES.keys())
+DEFAULT_CATEGORY = "general science"
 
-def classify_query(query):
+# Seed vocabulary for the local classifier, before any logged queries are available
+CATEGORY_KEYWORDS = {
+    "biology": "biology cell cells gene genes genome genomics protein proteins evolution species organism ecology microbiome bacteria dna rna crispr molecular",
+    "chemistry": "chemistry chemical molecule molecules synthesis catalyst catalysis reaction polymer compound organic inorganic electrochemistry spectroscopy",
+    "computer science": "computer software algorithm algorithms machine learning deep neural network networks artificial intelligence llm language models computing data programming robotics",
+    "economics": "economics economy economic inflation labor market markets trade gdp monetary policy growth unemployment wages macroeconomics microeconomics",
+    "engineering": "engineering mechanical electrical civil aerospace design materials structures control systems circuits manufacturing",
+    "environmental science": "climate change environment environmental carbon emissions renewable energy solar wind pollution sustainability ecosystem biodiversity",
+    "finance": "finance financial stock stocks asset pricing portfolio banking investment investors credit risk returns bonds",
+    "general science": "science scientific discovery discoveries breakthrough breakthroughs findings groundbreaking",
+    "math": "math mathematics mathematical theorem proof algebra geometry topology calculus equations probability combinatorics number theory",
+    "medicine": "medicine medical clinical patients disease treatment therapy drug trial cancer diagnosis surgery vaccine hospital",
+    "neuroscience": "neuroscience brain neuron neurons neural cortex cognition consciousness synaptic hippocampus memory neurological",
+    "physics": "physics quantum particle particles relativity gravity cosmology astrophysics optics laser condensed matter photon photons dark",
+    "psychology": "psychology behavior behaviour cognitive emotion emotions personality mental social anxiety depression perception",
+    "public health": "public health epidemiology population pandemic covid infection prevention mortality obesity smoking vaccination outbreak"
+}
+
+# Logged query -> category pairs used to train the local classifier
+QUERY_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "classifier_data", "query_categories.jsonl")
+
+# Below this confidence, the local classifier defers to the LLM. Naive Bayes posteriors
+# are not calibrated probabilities, so 0.7 is only a starting point: once enough queries
+# are logged, the threshold is recalibrated on held-out logged pairs (see calibrate_threshold)
+LOCAL_CONFIDENCE_THRESHOLD = 0.7
+
+# Calibration holds out every Nth logged pair, and needs at least this many pairs to run
+MIN_CALIBRATION_PAIRS = 50
+CALIBRATION_HOLDOUT_EVERY = 5
+# Share of held-out queries the local classifier must label like the LLM did, above the threshold
+TARGET_LOCAL_ACCURACY = 0.9
+
+
+class LocalCategoryClassifier:
+    """
+    Multinomial naive Bayes over query tokens. Trained from the seed keywords
+    plus every logged query -> category pair, and updated online as the LLM
+    labels new queries.
+    """
+
+    def __init__(self, categories, smoothing=0.1, threshold=LOCAL_CONFIDENCE_THRESHOLD):
+        self.categories = list(categories)
+        self.smoothing = smoothing
+        self.threshold = threshold
+        self.token_counts = {c: Counter() for c in self.categories}
+        self.total_tokens = defaultdict(int)
+        self.doc_counts = defaultdict(int)
+        self.vocabulary = set()
+
+    def learn(self, text, category):
+        if category not in self.token_counts:
+            return
+        tokens = tokenize(text)
+        self.token_counts[category].update(tokens)
+        self.total_tokens[category] += len(tokens)
+        self.doc_counts[category] += 1
+        self.vocabulary.update(tokens)
+
+    def predict(self, text):
+        """
+        Returns (category, confidence), or (None, 0.0) if the query has no known words.
+        The confidence is the naive Bayes posterior, which is usually overconfident.
+        """
+        tokens = [t for t in tokenize(text) if t in self.vocabulary]
+        if not tokens:
+            return None, 0.0
+
+        vocab_size = len(self.vocabulary)
+        total_docs = sum(self.doc_counts.values())
+        log_probs = {}
+        for c in self.categories:
+            log_prob = math.log((self.doc_counts[c] + 1) / (total_docs + len(self.categories)))
+            denominator = self.total_tokens[c] + self.smoothing * vocab_size
+            for t in tokens:
+                log_prob += math.log((self.token_counts[c][t] + self.smoothing) / denominator)
+            log_probs[c] = log_prob
+
+        best = max(log_probs, key=log_probs.get)
+        norm = sum(math.exp(lp - log_probs[best]) for lp in log_probs.values())
+        return best, 1.0 / norm
+
+
+def calibrate_threshold(classifier, pairs, target_accuracy=TARGET_LOCAL_ACCURACY):
+    """
+    Returns the lowest confidence threshold at which the classifier's answers on the
+    held-out (query, category) pairs are at least target_accuracy correct, or 1.0
+    (always ask the LLM) if no threshold gets there.
+    """
+    predictions = []
+    for query, expected in pairs:
+        category, confidence = classifier.predict(query)
+        if category is not None:
+            predictions.append((confidence, category == expected))
+    predictions.sort(reverse=True)
+
+    threshold = 1.0
+    correct = 0
+    for answered, (confidence, is_correct) in enumerate(predictions, start=1):
+        correct += is_correct
+        if correct / answered >= target_accuracy:
+            threshold = confidence
+    return threshold
+
+_local_classifier = None
+_classifier_lock = threading.Lock()
+
+def get_local_classifier():
+    """
+    Builds the local classifier once from the seed keywords and the query log,
+    calibrating its confidence threshold when the log is large enough.
+    """
+    global _local_classifier
+    with _classifier_lock:
+        if _local_classifier is None:
+            classifier = LocalCategoryClassifier(VALID_CATEGORIES)
+            for category, keywords in CATEGORY_KEYWORDS.items():
+                classifier.learn(keywords, category)
+
+            pairs = []
+            if os.path.exists(QUERY_LOG_PATH):
+                with open(QUERY_LOG_PATH, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            pairs.append((entry["query"], entry["category"]))
+                        except (ValueError, KeyError):
+                            continue
+
+            held_out = pairs[::CALIBRATION_HOLDOUT_EVERY] if len(pairs) >= MIN_CALIBRATION_PAIRS else []
+            for i, (query, category) in enumerate(pairs):
+                if not held_out or i % CALIBRATION_HOLDOUT_EVERY:
+                    classifier.learn(query, category)
+            if held_out:
+                classifier.threshold = calibrate_threshold(classifier, held_out)
+                for query, category in held_out:
+                    classifier.learn(query, category)
+            _local_classifier = classifier
+    return _local_classifier
+
+def log_query_category(query, category):
+    """
+    Records an LLM-labelled query so the local classifier learns from it now and on next start.
+    """
+    get_local_classifier().learn(query, category)
+    try:
+        os.makedirs(os.path.dirname(QUERY_LOG_PATH), exist_ok=True)
+        with _classifier_lock, open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"query": query, "category": category}) + "\n")
+    except OSError as e:
+        print(f"⚠️ Could not log query category: {e}")
+
+@shared_cached("classify")
+def classify_query_with_llm(query):
     """
     Uses GPT to classify a user query into a scientific domain.
     """
@@ -49,14 +207,32 @@ def classify_query(query):
     )
 
     category = response.choices[0].message.content.strip().lower()
-    return category if category in VALID_CATEGORIES else "general_science"
+    return category if category in VALID_CATEGORIES else None
+
+def classify_query(query, confidence_threshold=None):
+    """
+    Classifies a query into a scientific domain, using the local classifier when it
+    is confident enough (its calibrated threshold by default) and escalating to GPT otherwise.
+    """
+    classifier = get_local_classifier()
+    category, confidence = classifier.predict(query)
+    threshold = classifier.threshold if confidence_threshold is None else confidence_threshold
+    if category is not None and confidence >= threshold:
+        return category
+
+    llm_category = classify_query_with_llm(query)
+    if llm_category is None:
+        return category or DEFAULT_CATEGORY
+
+    log_query_category(query, llm_category)
+    return llm_category
 
 def select_sources(refined_query):
     """
     Determines the best sources based on category classification.
     """
     category = classify_query(refined_query)
-    sources = SOURCE_CATEGORIES[category]
+    sources = SOURCE_CATEGORIES.get(category, SOURCE_CATEGORIES[DEFAULT_CATEGORY])
 
     return {"category": category, "sources": sources}
 
@@ -0,0 +1,281 @@
+import os
+import re
+import json
+import heapq
+import hashlib
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import requests
+from dotenv import load_dotenv
+from openai import OpenAI
+from pypdf import PdfReader
+from source_scraper import paper_keys
+from text_utils import tokenize
+
+# 🔑 API
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+client = OpenAI(api_key=OPENAI_API_KEY)
+
+FULLTEXT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fulltext_cache")
+PDF_DIR = os.path.join(FULLTEXT_DIR, "pdfs")
+CHUNK_DIR = os.path.join(FULLTEXT_DIR, "chunks")
+URL_DIR = os.path.join(FULLTEXT_DIR, "urls")
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+MAX_PDF_BYTES = 50 * 1024 * 1024
+CHUNK_WORDS = 300
+CHUNK_OVERLAP_WORDS = 50
+
+# Max words of full text sent to GPT for one answer or study summary
+MAX_CONTEXT_WORDS = 3000
+
+_extract_pool = None
+
+
+def pdf_url(study):
+    """
+    Returns the open-access PDF link for a study (arXiv first), or None.
+    """
+    url = study.get("url", "")
+    match = re.search(r"arxiv\.org/(?:abs|pdf)/([^\s?#]+?)(?:\.pdf)?$", url)
+    if match:
+        return f"https://arxiv.org/pdf/{match.group(1)}"
+    if study.get("pdf_url"):
+        return study["pdf_url"]
+    if url.lower().endswith(".pdf"):
+        return url
+    return None
+
+# --- Download --- #
+
+def download_pdf(url):
+    """
+    Streams a PDF into the content-addressed cache (named by its SHA-256) without
+    holding it in memory. Returns the content hash, or None if the download failed.
+    """
+    for directory in (PDF_DIR, URL_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+    url_path = os.path.join(URL_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest())
+    if os.path.exists(url_path):
+        with open(url_path, encoding="utf-8") as f:
+            sha = f.read().strip()
+        if os.path.exists(os.path.join(PDF_DIR, f"{sha}.pdf")):
+            return sha
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=PDF_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f, requests.get(url, stream=True, timeout=30) as response:
+            if response.status_code != 200:
+                print(f"⚠️ PDF download failed ({response.status_code}): {url}")
+                return None
+            for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                size += len(block)
+                if size > MAX_PDF_BYTES:
+                    print(f"⚠️ PDF larger than {MAX_PDF_BYTES // (1024 * 1024)} MB, skipping: {url}")
+                    return None
+                digest.update(block)
+                f.write(block)
+
+        sha = digest.hexdigest()
+        pdf_path = os.path.join(PDF_DIR, f"{sha}.pdf")
+        if os.path.exists(pdf_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, pdf_path)
+        with open(url_path, "w", encoding="utf-8") as f:
+            f.write(sha)
+        return sha
+    except requests.RequestException as e:
+        print(f"⚠️ PDF download failed: {e}")
+        return None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# --- Extraction and chunking --- #
+
+def extract_chunks(sha):
+    """
+    Extracts a cached PDF page by page into overlapping word chunks, written to
+    a JSONL file as they are produced, so only one page and one chunk are held
+    in memory at a time. Runs in a worker process. Returns the number of chunks.
+    """
+    chunks_path = os.path.join(CHUNK_DIR, f"{sha}.jsonl")
+    if os.path.exists(chunks_path):
+        with open(chunks_path, encoding="utf-8") as f:
+            return sum(1 for _ in f)
+
+    os.makedirs(CHUNK_DIR, exist_ok=True)
+    # A unique temp file, so concurrent extractions of the same PDF never share one
+    fd, tmp_path = tempfile.mkstemp(dir=CHUNK_DIR, suffix=".part")
+    count = 0
+    words = []
+    start_page = 1
+
+    try:
+        # Given a path, pypdf reads the whole file into memory; given a handle, it reads pages as needed
+        with os.fdopen(fd, "w", encoding="utf-8") as out, open(os.path.join(PDF_DIR, f"{sha}.pdf"), "rb") as pdf:
+            reader = PdfReader(pdf)
+
+            def write_chunk(chunk_words, page):
+                text = " ".join(chunk_words)
+                out.write(json.dumps({
+                    "chunk": count,
+                    "page": page,
+                    "text": text,
+                    "terms": Counter(tokenize(text))
+                }) + "\n")
+
+            for page_number, page in enumerate(reader.pages, start=1):
+                try:
+                    page_words = (page.extract_text() or "").split()
+                except Exception as e:
+                    print(f"⚠️ Could not extract page {page_number}: {e}")
+                    continue
+                if not words:
+                    start_page = page_number
+                words.extend(page_words)
+
+                while len(words) >= CHUNK_WORDS:
+                    write_chunk(words[:CHUNK_WORDS], start_page)
+                    count += 1
+                    words = words[CHUNK_WORDS - CHUNK_OVERLAP_WORDS:]
+                    start_page = page_number
+
+            if len(words) > CHUNK_OVERLAP_WORDS or (words and count == 0):
+                write_chunk(words, start_page)
+                count += 1
+
+        os.replace(tmp_path, chunks_path)
+        return count
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def get_extract_pool():
+    global _extract_pool
+    if _extract_pool is None:
+        _extract_pool = ProcessPoolExecutor(max_workers=max(1, min(4, (os.cpu_count() or 2) - 1)))
+    return _extract_pool
+
+def deep_dive(studies, max_downloads=4):
+    """
+    Downloads and indexes the full text of every study with an open-access PDF.
+    Downloads run concurrently, and each PDF is handed to the extraction process
+    pool as soon as it arrives.
+
+    Returns:
+        Dict mapping each study's key to {"sha": content hash, "chunks": chunk count}
+    """
+    targets = [(paper_keys(s)[0], pdf_url(s)) for s in studies if paper_keys(s) and pdf_url(s)]
+    if not targets:
+        return {}
+
+    pool = get_extract_pool()
+    extractions = {}
+    with ThreadPoolExecutor(max_workers=max_downloads) as downloads:
+        def fetch_and_extract(target):
+            key, url = target
+            sha = download_pdf(url)
+            if sha:
+                extractions[key] = (sha, pool.submit(extract_chunks, sha))
+
+        list(downloads.map(fetch_and_extract, targets))
+
+    docs = {}
+    for key, (sha, future) in extractions.items():
+        try:
+            docs[key] = {"sha": sha, "chunks": future.result()}
+        except Exception as e:
+            print(f"⚠️ Could not extract text from {sha[:12]}: {e}")
+    return docs
+
+# --- Retrieval --- #
+
+def iter_chunks(sha):
+    with open(os.path.join(CHUNK_DIR, f"{sha}.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def retrieve_chunks(question, docs, top_k=6):
+    """
+    Streams through the indexed chunks of the given documents and keeps the
+    top_k chunks with the most (length-normalized) query term matches.
+
+    Returns:
+        List of (score, study key, chunk) tuples, best first
+    """
+    query_terms = set(tokenize(question))
+    best = []
+    for key, doc in docs.items():
+        for chunk in iter_chunks(doc["sha"]):
+            terms = chunk["terms"]
+            matches = sum(1 + (terms[t] > 1) for t in query_terms if t in terms)
+            if not matches:
+                continue
+            score = matches / (1 + len(chunk["text"].split()) / CHUNK_WORDS)
+            entry = (score, key, chunk["chunk"], chunk)
+            if len(best) < top_k:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heappushpop(best, entry)
+    return [(score, key, chunk) for score, key, _, chunk in sorted(best, reverse=True)]
+
+def build_context(chunks, studies):
+    titles = {paper_keys(s)[0]: s.get("title", "Untitled") for s in studies if paper_keys(s)}
+    context = []
+    words = 0
+    for _, key, chunk in chunks:
+        chunk_words = len(chunk["text"].split())
+        if words + chunk_words > MAX_CONTEXT_WORDS:
+            break
+        words += chunk_words
+        context.append(f"From \"{titles.get(key, 'Unknown study')}\" (page {chunk['page']}):\n{chunk['text']}")
+    return "\n\n".join(context)
+
+def answer_question(question, studies, docs=None, history=None):
+    """
+    Answers a follow-up question from the full text of the studies (falling back
+    to their abstracts when no full text is available).
+    """
+    docs = docs if docs is not None else deep_dive(studies)
+    context = build_context(retrieve_chunks(question, docs), studies)
+    if not context:
+        context = "\n\n".join(f"\"{s.get('title', 'Untitled')}\": {s.get('summary') or 'No summary available.'}" for s in studies)
+
+    messages = [{"role": "system", "content": (
+        "You are Kanopik, a research assistant. Answer the user's question using the study excerpts below, "
+        "citing the study title for each point. If the excerpts don't answer it, say so.\n\n" + context
+    )}]
+    messages += history or []
+    messages.append({"role": "user", "content": question})
+
+    response = client.chat.completions.create(model="gpt-4o-mini", messages=messages)
+    return response.choices[0].message.content
+
+def summarize_study(study, doc):
+    """
+    Summarizes one study from its full text: methods, participants or data, results, and limitations.
+    """
+    question = f"{study.get('title', '')} methods participants data results findings limitations conclusion"
+    context = build_context(retrieve_chunks(question, {paper_keys(study)[0]: doc}, top_k=10), [study])
+
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You are Kanopik, a research assistant that writes concise, accurate study deep dives."},
+            {"role": "user", "content": (
+                f"Using these excerpts from \"{study.get('title', 'Untitled')}\", summarize the study's goal, methods, "
+                f"participants or data, key results, and limitations in a few short paragraphs.\n\n{context}"
+            )}
+        ]
+    )
+    return response.choices[0].message.content
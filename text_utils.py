@@ -0,0 +1,16 @@
+import re
+
+# Common English words that carry no topical signal
+STOPWORDS = {
+    "a", "about", "across", "after", "all", "an", "and", "any", "are", "as", "at", "be", "been",
+    "between", "by", "can", "do", "does", "for", "from", "has", "have", "how", "in", "into", "is",
+    "it", "its", "latest", "new", "of", "on", "or", "over", "recent", "research", "some", "that",
+    "the", "their", "there", "these", "this", "to", "under", "updates", "using", "was", "what",
+    "when", "where", "which", "who", "why", "with", "within", "without"
+}
+
+def tokenize(text):
+    """
+    Lowercases text and splits it into word tokens, dropping stopwords and very short tokens.
+    """
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(t) > 2 and t not in STOPWORDS]
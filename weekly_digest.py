@@ -1,7 +1,10 @@
 import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from research_agent import research_agent
+from research_agent import save_study_metadata, summarize_research
+from source_selector import select_sources
+from source_scraper import fetch_from_sources, dedupe_papers
+from relevance_filter import route_papers_to_topics
 
 # Load API keys from .env
 load_dotenv()
@@ -13,6 +16,29 @@ USER_TOPICS = [
     "Groundbreaking new research findings across all of science"
 ]
 
+def plan_weekly_digest(topics, since_date, progress_slot=None):
+    """
+    Plans the digest across all topics at once:
+    1. Collects candidate papers for every topic
+    2. Dedupes them into one shared pool
+    3. Scores each unique paper against all topics in one call and routes it
+
+    Returns a dict mapping each topic to its relevant papers.
+    """
+    candidates = []
+    for topic in topics:
+        selection = select_sources(topic)
+        if progress_slot:
+            progress_slot.markdown(f"🔍 Searching {', '.join(selection['sources'])} for: **{topic}**")
+        candidates.extend(fetch_from_sources(topic, selection["sources"], since_date=since_date))
+
+    unique_papers = dedupe_papers(candidates)
+    if progress_slot:
+        progress_slot.markdown(f"📄 Retrieved {len(candidates)} papers ({len(unique_papers)} unique) across {len(topics)} topics")
+        progress_slot.markdown("🧹 Scoring papers against all topics...")
+
+    return route_papers_to_topics(unique_papers, topics)
+
 def generate_weekly_digest(topics, progress_slot=None):
     today = datetime.now().strftime("%Y-%m-%d")
     filename = f"kanopik_weekly_digest_{today}.txt"
@@ -23,6 +49,7 @@ def generate_weekly_digest(topics, progress_slot=None):
     print(f"\n Generating Kanopik Weekly Digest for {today}...\n")
 
     since_date = datetime.now().date() - timedelta(days=7)
+    routed = plan_weekly_digest(topics, since_date, progress_slot=progress_slot)
     results = {}
 
     with open(filepath, "w", encoding="utf-8") as file:
@@ -30,9 +57,14 @@ def generate_weekly_digest(topics, progress_slot=None):
         file.write("=" * 60 + "\n\n")
 
         for topic in topics:
-            if progress_slot:
-                progress_slot.markdown(f"🔍 Researching: **{topic}**")
-            summary, sources = research_agent(topic, digest_mode=True, since_date=since_date, progress_slot=progress_slot)
+            sources = routed.get(topic, [])
+            if sources:
+                if progress_slot:
+                    progress_slot.markdown(f"📝 Summarizing: **{topic}**")
+                save_study_metadata(topic, sources)
+                summary = summarize_research(topic, sources, digest_mode=True, since_date=since_date)
+            else:
+                summary = "⚠️ No new relevant papers found on this topic this week."
 
             if progress_slot:
                 progress_slot.markdown(f"✅ Finished topic: {topic} — {len(sources)} studies found\n")